@@ -0,0 +1,205 @@
+# benchmarks/bench_api.py
+"""
+So sánh API chạy bằng runserver (WSGI, cách cũ) và uvicorn (ASGI):
+  - throughput khi nhiều client cùng download một bản ghi lớn
+  - độ trễ POST /api/meet trong lúc các download đó đang chạy
+
+Script tự dựng server trên cổng trống với REC_DIR tạm và MEETBOT_SCRIPT là một
+script rỗng (không mở Chrome). Chạy từ thư mục gốc repo:
+
+  python3 benchmarks/bench_api.py --server both --downloads 16 --file-mb 256 --submits 200
+
+Hoặc đo một server đang chạy sẵn (file phải có trong REC_DIR của server đó):
+
+  python3 benchmarks/bench_api.py --url http://127.0.0.1:9000 --file rec-xxxx.mkv
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import http.client
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+ROOT = Path(__file__).resolve().parent.parent
+MEET_LINK = "https://meet.google.com/abc-defg-hij"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _conn(base: str):
+    u = urlparse(base)
+    return http.client.HTTPConnection(u.hostname, u.port or 80, timeout=120)
+
+
+def _peak_rss_mb(pid: int):
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def start_server(kind: str, rec_dir: Path, bot_script: Path):
+    port = _free_port()
+    env = os.environ.copy()
+    env.update({
+        "DJANGO_ALLOWED_HOSTS": "127.0.0.1 localhost",
+        "SECRET_KEY": "bench",
+        "DEBUG": "0",
+        "REC_DIR": str(rec_dir),
+        "MEETBOT_SCRIPT": str(bot_script),
+    })
+    for k in ("WEBHOOK_URL", "S3_BUCKET"):
+        env.pop(k, None)
+    if kind == "runserver":
+        cmd = [sys.executable, "manage.py", "runserver", f"127.0.0.1:{port}", "--noreload"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "djangobot.asgi:application",
+               "--host", "127.0.0.1", "--port", str(port), "--lifespan", "off", "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            c = _conn(base)
+            c.request("GET", "/api/metrics")
+            if c.getresponse().status == 200:
+                return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{kind} did not start")
+
+
+def download(base: str, fname: str) -> int:
+    c = _conn(base)
+    c.request("GET", f"/api/recordings/{fname}")
+    r = c.getresponse()
+    if r.status != 200:
+        raise RuntimeError(f"download {fname}: HTTP {r.status}")
+    n = 0
+    while True:
+        chunk = r.read(1024 * 1024)
+        if not chunk:
+            break
+        n += len(chunk)
+    c.close()
+    return n
+
+
+def submit(base: str) -> float:
+    t0 = time.perf_counter()
+    c = _conn(base)
+    c.request("POST", "/api/meet", body=json.dumps({"meetlink": MEET_LINK}),
+              headers={"Content-Type": "application/json"})
+    r = c.getresponse()
+    r.read()
+    c.close()
+    if r.status != 202:
+        raise RuntimeError(f"submit: HTTP {r.status}")
+    return time.perf_counter() - t0
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_bench(base: str, fname: str, downloads: int, submits: int, concurrency: int):
+    # 1) chỉ download song song
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(downloads) as pool:
+        total = sum(pool.map(lambda _: download(base, fname), range(downloads)))
+    dl_s = time.perf_counter() - t0
+
+    # 2) submit trong lúc download vẫn chạy
+    stop = threading.Event()
+
+    def keep_downloading():
+        while not stop.is_set():
+            download(base, fname)
+
+    loaders = [threading.Thread(target=keep_downloading, daemon=True) for _ in range(downloads)]
+    for t in loaders:
+        t.start()
+    time.sleep(0.5)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        lat = list(pool.map(lambda _: submit(base), range(submits)))
+    sub_s = time.perf_counter() - t0
+    stop.set()
+    for t in loaders:
+        t.join()
+
+    return {
+        "download_MBps": round(total / dl_s / (1024 * 1024), 1),
+        "download_wall_s": round(dl_s, 2),
+        "submit_p50_ms": round(statistics.median(lat) * 1000, 1),
+        "submit_p95_ms": round(_pct(lat, 95) * 1000, 1),
+        "submit_max_ms": round(max(lat) * 1000, 1),
+        "submit_per_s": round(submits / sub_s, 1),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark concurrent downloads and submit latency")
+    p.add_argument("--server", choices=["runserver", "uvicorn", "both"], default="both")
+    p.add_argument("--url", help="benchmark an already running server instead")
+    p.add_argument("--file", help="recording filename to download (with --url)")
+    p.add_argument("--file-mb", type=int, default=128)
+    p.add_argument("--downloads", type=int, default=16)
+    p.add_argument("--submits", type=int, default=100)
+    p.add_argument("--concurrency", type=int, default=16)
+    args = p.parse_args()
+
+    if args.url:
+        if not args.file:
+            p.error("--file is required with --url")
+        print(json.dumps(run_bench(args.url, args.file, args.downloads, args.submits, args.concurrency), indent=2))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="meetbot-bench-") as tmp:
+        rec_dir = Path(tmp)
+        bot_script = rec_dir / "noop_bot.py"
+        bot_script.write_text("")
+        fname = "rec-bench.mkv"
+        block = os.urandom(1024 * 1024)
+        with open(rec_dir / fname, "wb") as f:
+            for _ in range(args.file_mb):
+                f.write(block)
+
+        kinds = ["runserver", "uvicorn"] if args.server == "both" else [args.server]
+        results = {}
+        for kind in kinds:
+            proc, base = start_server(kind, rec_dir, bot_script)
+            try:
+                results[kind] = run_bench(base, fname, args.downloads, args.submits, args.concurrency)
+                results[kind]["server_peak_rss_MB"] = _peak_rss_mb(proc.pid)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    print(f"file={args.file_mb}MB downloads={args.downloads} submits={args.submits} concurrency={args.concurrency}")
+    keys = list(next(iter(results.values())).keys())
+    print(f"{'':22}" + "".join(f"{k:>12}" for k in results))
+    for k in keys:
+        print(f"{k:22}" + "".join(f"{str(results[kind][k]):>12}" for kind in results))
+
+
+if __name__ == "__main__":
+    main()
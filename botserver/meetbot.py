@@ -5,12 +5,13 @@ import platform
 import subprocess
 import argparse
 import shutil
+import signal
 import atexit
 import tempfile
 import json
 import urllib.request, urllib.error
 from pathlib import Path
-from threading import Thread
+from threading import Thread, Event
 
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
@@ -20,6 +21,98 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 
+try:
+    from botserver import offload
+except ImportError:          # chạy trực tiếp: python3 ./botserver/meetbot.py
+    import offload
+
+
+# Observer trong trang: gom phụ đề Meet vào buffer, Python chỉ drain theo lô (1 execute_script / vòng watch).
+# Mỗi khối phụ đề (1 người nói) được chốt thành 1 dòng khi im lặng > settle ms hoặc khối bị gỡ khỏi DOM.
+CAPTIONS_OBSERVER_JS = r"""
+if (window.__meetbotCaptions) return true;
+const REGION = 'div[role="region"][aria-label="Captions"], div[role="region"][aria-label="Phụ đề"], div.a4cQT';
+const BLOCK = 'div.nMcdL, div.TBMuR';
+const SPEAKER = '.NWpY1d, .zs7s8d, .KcIKyf';
+const TEXT = '.bh44bd, .ygicle, .iTTPOb';
+const st = {live: new Map(), done: new WeakMap(), seq: 0, region: null, obs: null};
+
+function read(block) {
+  const sp = block.querySelector(SPEAKER);
+  const tx = block.querySelector(TEXT);
+  return {speaker: sp ? sp.textContent.trim() : null, text: tx ? tx.textContent.trim() : ""};
+}
+// Phần mới của khối so với text đã drain. Meet sửa chữ cũ tại chỗ và cắt bớt dòng đầu
+// của khối dài, nên không cắt theo độ dài cũ mà theo tiền tố chung / đoạn gối đầu.
+function fresh(prev, cur) {
+  let i = 0;
+  while (i < prev.length && i < cur.length && prev[i] === cur[i]) i++;
+  if (i < prev.length) {
+    for (let k = Math.min(prev.length, cur.length); k > i; k--) {
+      if (prev.endsWith(cur.slice(0, k))) { i = k; break; }
+    }
+  }
+  // chữ cuối đã drain có thể được nói tiếp/sửa ("no" -> "nothing"): lùi về đầu chữ, phát lại cả chữ
+  if (i > 0 && i < cur.length && /\S/.test(cur[i - 1]) && /\S/.test(cur[i])) {
+    while (i > 0 && /\S/.test(cur[i - 1])) i--;
+  }
+  return cur.slice(i).trim();
+}
+function touch(block) {
+  const now = Date.now();
+  const cur = read(block);
+  const text = fresh(st.done.get(block) || "", cur.text);
+  if (!text) return;
+  const e = st.live.get(block);
+  if (!e) {
+    st.live.set(block, {id: ++st.seq, speaker: cur.speaker, text, start: now, end: now, full: cur.text});
+  } else if (e.text !== text) {
+    e.text = text; e.end = now; e.full = cur.text;
+    if (cur.speaker) e.speaker = cur.speaker;
+  }
+}
+function attach() {
+  const region = document.querySelector(REGION);
+  if (!region || region === st.region) return;
+  if (st.obs) st.obs.disconnect();
+  st.region = region;
+  st.obs = new MutationObserver(muts => {
+    const dirty = new Set();
+    for (const m of muts) {
+      const node = m.target.nodeType === 1 ? m.target : m.target.parentElement;
+      const b = node && node.closest(BLOCK);
+      if (b) dirty.add(b);
+      for (const n of m.addedNodes) {
+        if (n.nodeType === 1 && n.matches(BLOCK)) dirty.add(n);
+      }
+    }
+    dirty.forEach(touch);
+  });
+  st.obs.observe(region, {childList: true, subtree: true, characterData: true});
+  region.querySelectorAll(BLOCK).forEach(touch);
+}
+st.drain = function (settleMs, force) {
+  attach();
+  const now = Date.now(), out = [];
+  for (const [block, e] of st.live) {
+    if (force || !block.isConnected || now - e.end > settleMs) {
+      out.push({id: e.id, speaker: e.speaker, text: e.text, start: e.start, end: e.end});
+      st.done.set(block, e.full);
+      st.live.delete(block);
+    }
+  }
+  return out;
+};
+window.__meetbotCaptions = st;
+attach();
+return true;
+"""
+
+CAPTIONS_DRAIN_JS = """
+const st = window.__meetbotCaptions;
+return st ? st.drain(arguments[0], arguments[1]) : null;
+"""
+
 
 def remove_singleton_locks(folder: Path):
     for name in ["SingletonLock", "SingletonCookie", "SingletonSocket"]:
@@ -41,9 +134,13 @@ class MeetBot:
         min_members: int = 1,
         min_record_seconds: int = 200,
         bot_name: str = "Recorder Bot",
+        transcript: bool = False,
+        video: bool = True,
     ):
         if not meet_link:
             raise ValueError("meet_link is required")
+        if not (video or transcript):
+            raise ValueError("nothing to capture: enable video and/or transcript")
 
         self.meet_link = meet_link
         self.profile_root = Path(profile_dir).expanduser().resolve() / profile_name
@@ -54,10 +151,17 @@ class MeetBot:
         self.min_members = int(min_members)
         self.min_record_seconds = int(min_record_seconds)
         self.bot_name = bot_name
+        self.transcript = transcript
+        self.video = video
 
         self.browser = None
         self.rec_proc = None
         self.rec_output_path = None
+        self.upload_info = None
+        self.transcript_path = None
+        self.transcript_upload_info = None
+        self._joined_at = None
+        self._stop = Event()   # set khi nhận SIGTERM (vd: server báo vượt ngưỡng RAM/CPU)
         
         self.webhook_url = os.getenv("WEBHOOK_URL", "").strip() or None
         self.public_base = os.getenv("REC_PUBLIC_BASE", "").rstrip("/")
@@ -71,6 +175,9 @@ class MeetBot:
         print('Building Chrome driver...')
         W = os.getenv("REC_WIDTH", "1366")
         H = os.getenv("REC_HEIGHT", "768")
+        if not self.video:
+            # chỉ lấy transcript: cửa sổ nhỏ + tắt tiếng để Chrome render/decode ít hơn
+            W, H = os.getenv("TRANSCRIPT_WINDOW", "640,480").split(",")
         opts = webdriver.ChromeOptions()
         opts.add_argument(f"--user-data-dir={str(self._tmp_profile)}")
         opts.add_argument("--profile-directory=Default")
@@ -87,9 +194,12 @@ class MeetBot:
         opts.add_argument("--window-position=0,0")
         opts.add_argument("--force-device-scale-factor=1")
         opts.add_argument("--high-dpi-support=1")
+        if not self.video:
+            opts.add_argument("--mute-audio")
         if self.headless:
             opts.add_argument("--headless=new")
-            opts.add_argument("--window-size=1920,1080")
+            if self.video:
+                opts.add_argument("--window-size=1920,1080")
 
         service = Service(ChromeDriverManager().install())
         self.browser = webdriver.Chrome(service=service, options=opts)
@@ -108,6 +218,15 @@ class MeetBot:
         except Exception:
             pass
 
+    def _on_sigterm(self, signum, frame):
+        print("[meetbot] SIGTERM received. Stopping gracefully...")
+        self._stop.set()
+
+    def _output_dir(self) -> Path:
+        out_dir = Path(os.getenv("REC_DIR", "/var/app/recordings"))
+        out_dir.mkdir(parents=True, exist_ok=True)
+        return out_dir
+
     # ---------- Recorder (FULLSCREEN + HIGH QUALITY) ----------
     def _recorder_run(self):
         """
@@ -126,8 +245,7 @@ class MeetBot:
 
         # Linux/Docker: dùng Xvfb DISPLAY
         disp = os.environ.get("DISPLAY", ":99")
-        out_dir = Path(os.getenv("REC_DIR", "/var/app/recordings"))
-        out_dir.mkdir(parents=True, exist_ok=True)
+        out_dir = self._output_dir()
         rec_out_env = os.getenv("REC_OUT", "").strip()
         if rec_out_env:
             out_path = str(out_dir / rec_out_env)  # chỉ là "tên file", không path tuyệt đối
@@ -166,6 +284,70 @@ class MeetBot:
         except Exception:
             pass
 
+    # ---------- Captions (transcript sidecar) ----------
+    def _captions_start(self):
+        """
+        Bật phụ đề của Meet và cài observer trong trang.
+
+        Transcript ghi ra <REC_OUT>.transcript.jsonl (hoặc TRANSCRIPT_OUT), mỗi dòng:
+          {"start", "end"  (epoch ms), "offset_s" (giây từ lúc join), "speaker", "text"}
+        """
+        ts = time.strftime("%Y%m%d-%H%M%S")
+        name = os.getenv("TRANSCRIPT_OUT", "").strip()
+        if not name:
+            rec_out_env = os.getenv("REC_OUT", "").strip()
+            name = f"{Path(rec_out_env).stem}.transcript.jsonl" if rec_out_env else f"transcript-{ts}.jsonl"
+        self.transcript_path = str(self._output_dir() / name)
+        Path(self.transcript_path).touch()
+
+        print("[meetbot] Turning on captions...")
+        xpaths = [
+            '//button[@aria-label="Turn on captions"]',
+            '//button[contains(@aria-label, "Turn on captions")]',
+            '//button[contains(@aria-label, "Bật phụ đề")]',
+        ]
+        clicked = False
+        for xp in xpaths:
+            try:
+                self.browser.find_element(By.XPATH, xp).click()
+                clicked = True
+                break
+            except Exception:
+                pass
+        if not clicked:
+            try:
+                self.browser.find_element(By.TAG_NAME, "body").send_keys("c")   # phím tắt bật/tắt phụ đề
+            except Exception:
+                pass
+        try:
+            self.browser.execute_script(CAPTIONS_OBSERVER_JS)
+        except Exception as e:
+            print(f"[meetbot] Caption observer error: {e}")
+
+    def _captions_drain(self, force: bool = False):
+        if not self.transcript_path:
+            return
+        settle_ms = int(float(os.getenv("CAPTION_SETTLE_SECONDS", "3")) * 1000)
+        try:
+            entries = self.browser.execute_script(CAPTIONS_DRAIN_JS, settle_ms, force)
+            if entries is None:                  # trang reload -> cài lại observer
+                self.browser.execute_script(CAPTIONS_OBSERVER_JS)
+                return
+        except Exception as e:
+            print(f"[meetbot] Caption drain error: {e}")
+            return
+        if not entries:
+            return
+        with open(self.transcript_path, "a", encoding="utf-8") as f:
+            for e in sorted(entries, key=lambda e: e["start"]):
+                f.write(json.dumps({
+                    "start": e["start"],
+                    "end": e["end"],
+                    "offset_s": round(e["start"] / 1000 - self._joined_at, 1),
+                    "speaker": e["speaker"],
+                    "text": e["text"],
+                }, ensure_ascii=False) + "\n")
+
     # ---------- UI helpers ----------
     def _fill_guest_name_if_needed(self):
         wait = WebDriverWait(self.browser, 10)
@@ -249,11 +431,11 @@ class MeetBot:
     def _wait_until_joined(self, timeout=600):
         print(f"[meetbot] Waiting to be admitted (≤ {timeout}s)...")
         deadline = time.time() + timeout
-        while time.time() < deadline:
+        while time.time() < deadline and not self._stop.is_set():
             if self._is_in_call():
                 print("[meetbot] Admitted. Join confirmed.")
                 return True
-            time.sleep(2)
+            self._stop.wait(2)
         print("[meetbot] Waited too long but not admitted. Stop.")
         return False
 
@@ -285,17 +467,30 @@ class MeetBot:
         if not self.webhook_url:
             return
         try:
-            fname = Path(self.rec_output_path).name if self.rec_output_path else None
+            main_path = self.rec_output_path or self.transcript_path   # transcript-only: file chính là transcript
+            fname = Path(main_path).name if main_path else None
             payload = {
                 "event": event,                       # 'record_stopped'
                 "filename": fname,                    # ví dụ: rec-xxxx.mkv
-                "full_path": self.rec_output_path,    # đường dẫn trên server
+                "full_path": main_path,               # đường dẫn trên server
                 "meet_link": self.meet_link,
                 "timestamp": int(time.time()),
                 "message_id": self.message_id
             }
-            if self.public_base and fname:
+            main_upload = self.upload_info if self.rec_output_path else self.transcript_upload_info
+            if main_upload:
+                payload["file_url"] = main_upload["url"]               # object trên S3
+                payload["storage"] = "s3"
+                payload["upload"] = main_upload
+            elif self.public_base and fname:
                 payload["file_url"] = f"{self.public_base}/{fname}"   # vd: http://.../api/recordings/rec-xxxx.mkv"
+            if self.transcript_path:
+                tname = Path(self.transcript_path).name
+                payload["transcript_filename"] = tname
+                if self.transcript_upload_info:
+                    payload["transcript_url"] = self.transcript_upload_info["url"]
+                elif self.public_base:
+                    payload["transcript_url"] = f"{self.public_base}/{tname}"
 
             req = urllib.request.Request(
                 self.webhook_url,
@@ -309,14 +504,27 @@ class MeetBot:
             print(f"[meetbot] Webhook error: {e}")
 
 
+    def _offload_recording(self):
+        if not offload.enabled():
+            return
+        for attr, path in (("upload_info", self.rec_output_path), ("transcript_upload_info", self.transcript_path)):
+            if not path or not Path(path).is_file():
+                continue
+            try:
+                setattr(self, attr, offload.upload_file(path))
+            except Exception as e:
+                # giữ file local, webhook vẫn trỏ về server; chạy offload.py để resume
+                print(f"[meetbot] Offload error: {e}")
+
     # ---------- Meet flow ----------
     def _meet_join(self):
         self.browser.get(self.meet_link)
         try:
-            w = int(os.getenv("REC_WIDTH", "1920"))
-            h = int(os.getenv("REC_HEIGHT", "1080"))
-            self.browser.set_window_position(0, 0)
-            self.browser.set_window_size(w, h)
+            if self.video:
+                w = int(os.getenv("REC_WIDTH", "1920"))
+                h = int(os.getenv("REC_HEIGHT", "1080"))
+                self.browser.set_window_position(0, 0)
+                self.browser.set_window_size(w, h)
         except Exception:
             pass
         time.sleep(6)
@@ -336,8 +544,9 @@ class MeetBot:
         time.sleep(2)
 
     def _meeting_watch(self, joined_at: float):
-        while True:
+        while not self._stop.is_set():
             self._dismiss_popups()
+            self._captions_drain()
             if not self._is_in_call():
                 print("[meetbot] Not in call anymore (kicked/ended/disconnected).")
                 break
@@ -354,9 +563,10 @@ class MeetBot:
                         break
                 except Exception:
                     pass
-            time.sleep(4)
+            self._stop.wait(4)
 
     def run(self):
+        signal.signal(signal.SIGTERM, self._on_sigterm)
         self._build_driver()
         self._meet_join()
 
@@ -364,17 +574,21 @@ class MeetBot:
             self._quit_driver()
             return
 
-        joined_at = time.time()
-        t_rec = Thread(target=self._recorder_run, daemon=True)
+        joined_at = self._joined_at = time.time()
+        if self.transcript:
+            self._captions_start()
         t_mon = Thread(target=self._meeting_watch, args=(joined_at,), daemon=True)
-        t_rec.start()
+        if self.video:
+            Thread(target=self._recorder_run, daemon=True).start()
         t_mon.start()
         try:
             t_mon.join()
         finally:
             self._recorder_stop()
-            self._notify_webhook(event="record_stopped")
+            self._captions_drain(force=True)
             self._quit_driver()
+            self._offload_recording()
+            self._notify_webhook(event="record_stopped")
 
 
 def run_bot(
@@ -385,6 +599,8 @@ def run_bot(
     min_members: int = 1,
     min_record_seconds: int = 200,
     bot_name: str = "Recorder Bot",
+    transcript: bool = False,
+    video: bool = True,
 ):
     bot = MeetBot(
         meet_link=meet_link,
@@ -394,6 +610,8 @@ def run_bot(
         min_members=min_members,
         min_record_seconds=min_record_seconds,
         bot_name=bot_name,
+        transcript=transcript,
+        video=video,
     )
     bot.run()
 
@@ -407,6 +625,8 @@ def _parse_args():
     p.add_argument("--min-members", type=int, default=1)
     p.add_argument("--min-record-seconds", type=int, default=200)
     p.add_argument("--bot-name", default="Recorder Bot")
+    p.add_argument("--transcript", action="store_true", help="capture live captions into a .transcript.jsonl sidecar")
+    p.add_argument("--no-video", dest="video", action="store_false", help="skip screen recording (use with --transcript)")
     return p.parse_args()
 
 
@@ -420,4 +640,6 @@ if __name__ == "__main__":
         min_members=args.min_members,
         min_record_seconds=args.min_record_seconds,
         bot_name=args.bot_name,
+        transcript=args.transcript,
+        video=args.video,
     )
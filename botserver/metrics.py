@@ -0,0 +1,325 @@
+# botserver/metrics.py
+import os
+import time
+import shutil
+import signal
+import threading
+from pathlib import Path
+
+
+SAMPLE_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5"))
+JOB_RETENTION = int(os.getenv("METRICS_JOB_RETENTION", "3600"))   # giữ job đã kết thúc bao lâu (s)
+
+# Ngưỡng cho mỗi job (0 = tắt). Vượt ngưỡng JOB_LIMIT_SAMPLES lần liên tiếp -> SIGTERM (bot dừng êm)
+# RAM so với PSS (chia đều trang dùng chung giữa các process), không phải RSS cộng dồn
+JOB_MAX_PSS_MB = int(os.getenv("JOB_MAX_PSS_MB", "0"))
+JOB_MAX_CPU_PCT = float(os.getenv("JOB_MAX_CPU_PCT", "0"))
+JOB_LIMIT_SAMPLES = int(os.getenv("JOB_LIMIT_SAMPLES", "3"))
+# Sau SIGTERM mà cây process vẫn còn sống quá JOB_KILL_GRACE giây -> SIGKILL cả cây (bot bị treo)
+JOB_KILL_GRACE = int(os.getenv("JOB_KILL_GRACE", "60"))
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _parse_stat(raw: str):
+    """Tách một dòng /proc/<pid>/stat -> (ppid, comm, cpu_ticks, rss_bytes)."""
+    # comm nằm trong (...) và có thể chứa khoảng trắng
+    lp, rp = raw.find("("), raw.rfind(")")
+    comm = raw[lp + 1:rp]
+    fields = raw[rp + 2:].split()
+    ppid = int(fields[1])
+    ticks = int(fields[11]) + int(fields[12])   # utime + stime
+    rss = int(fields[21]) * _PAGE_SIZE
+    return ppid, comm, ticks, rss
+
+
+def _read_pss(pid: int):
+    """
+    PSS (bytes) từ /proc/<pid>/smaps_rollup; None nếu không đọc được.
+
+    RSS tính thư viện/shared memory một lần cho mỗi process nên cộng RSS cả cây
+    Chrome bị phóng đại nhiều lần; tổng PSS thì không.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "rb") as f:
+            for line in f:
+                if line.startswith(b"Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _read_proc_table():
+    """
+    Đọc /proc/<pid>/stat của mọi process một lần.
+    Trả về {pid: (ppid, comm, cpu_ticks, rss_bytes)}.
+    """
+    table = {}
+    try:
+        pids = [int(n) for n in os.listdir("/proc") if n.isdigit()]
+    except OSError:
+        return table
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                raw = f.read().decode("utf-8", "replace")
+        except OSError:
+            continue
+        try:
+            table[pid] = _parse_stat(raw)
+        except (IndexError, ValueError):
+            continue
+    return table
+
+
+def _descendants(root: int, children: dict):
+    out, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        out.append(pid)
+        stack.extend(children.get(pid, ()))
+    return out
+
+
+def _bucket():
+    return {"procs": 0, "rss_bytes": 0, "pss_bytes": 0, "cpu_pct": 0.0}
+
+
+class Job:
+    def __init__(self, proc, filename: str, meet_link: str, message_id=None):
+        self.proc = proc
+        self.filename = filename
+        self.meet_link = meet_link
+        self.message_id = message_id
+        self.started_at = time.time()
+        self.ended_at = None
+        self.state = "queued"          # queued -> recording -> exited
+        self.limit_hit = None
+        self.term_sent_at = None
+        self.killed = False
+        self._over_limit = 0
+        self.sample = {}
+
+    def as_dict(self):
+        return {
+            "filename": self.filename,
+            "pid": self.proc.pid,
+            "meet_link": self.meet_link,
+            "message_id": self.message_id,
+            "state": self.state,
+            "returncode": self.proc.returncode,
+            "started_at": int(self.started_at),
+            "uptime_s": int((self.ended_at or time.time()) - self.started_at),
+            "limit_hit": self.limit_hit,
+            "killed": self.killed,
+            **self.sample,
+        }
+
+
+class JobRegistry:
+    """
+    Giữ handle các bot đã spawn và một thread nền duy nhất lấy mẫu /proc.
+
+    Endpoint chỉ đọc snapshot gần nhất, không quét /proc theo từng request.
+    Job ở trạng thái "queued" khi bot chưa bắt đầu ghi video/transcript (còn đang join/chờ duyệt);
+    queue_depth là số job như vậy.
+    """
+
+    def __init__(self, record_dir: Path, interval: float = SAMPLE_INTERVAL):
+        self.record_dir = Path(record_dir)
+        self.interval = interval
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._prev_ticks = {}
+        self._prev_at = None
+        self._snapshot = None
+
+    # ---------- API ----------
+    def register(self, proc, filename: str, meet_link: str, message_id=None):
+        job = Job(proc, filename, meet_link, message_id)
+        with self._lock:
+            self._jobs[filename] = job
+        self._ensure_started()
+        return job
+
+    def snapshot(self):
+        self._ensure_started()
+        with self._lock:
+            return self._snapshot
+
+    def job(self, filename: str):
+        self._ensure_started()
+        with self._lock:
+            job = self._jobs.get(filename)
+            return job.as_dict() if job else None
+
+    # ---------- Collector ----------
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if self._snapshot is None:
+                self._collect()     # mẫu đầu chạy đồng bộ để /api/metrics luôn đủ field ngay từ đầu
+            self._thread = threading.Thread(target=self._loop, name="metrics-collector", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self._collect()
+            except Exception as e:
+                print(f"[metrics] Collector error: {e}")
+
+    def _collect(self):
+        now = time.time()
+        table = _read_proc_table()
+        dt = (now - self._prev_at) if self._prev_at else None
+
+        children = {}
+        for pid, (ppid, _, _, _) in table.items():
+            children.setdefault(ppid, []).append(pid)
+
+        with self._lock:
+            jobs = list(self._jobs.values())
+
+        totals = {"bot": _bucket(), "chrome": _bucket(), "ffmpeg": _bucket(), "recording_bytes": 0}
+        for job in jobs:
+            if job.state == "exited":
+                continue
+            if job.proc.poll() is not None:      # poll() cũng reap zombie
+                job.state = "exited"
+                job.ended_at = now
+                job.sample = {}
+                continue
+
+            buckets = {"bot": _bucket(), "chrome": _bucket(), "ffmpeg": _bucket()}
+            tree = _descendants(job.proc.pid, children)
+            for pid in tree:
+                info = table.get(pid)
+                if not info:
+                    continue
+                _, comm, ticks, rss = info
+                if pid == job.proc.pid:
+                    b = buckets["bot"]
+                elif comm == "ffmpeg":
+                    b = buckets["ffmpeg"]
+                else:
+                    b = buckets["chrome"]         # chrome + chromedriver + renderer/gpu
+                b["procs"] += 1
+                b["rss_bytes"] += rss
+                pss = _read_pss(pid)
+                b["pss_bytes"] += rss if pss is None else pss
+                prev = self._prev_ticks.get(pid)
+                if dt and prev is not None:
+                    b["cpu_pct"] += (ticks - prev) / _CLK_TCK / dt * 100
+
+            try:
+                rec_bytes = (self.record_dir / job.filename).stat().st_size
+                rec_exists = True
+            except OSError:
+                rec_bytes, rec_exists = 0, False
+            if buckets["ffmpeg"]["procs"] or rec_exists:   # transcript-only: không có ffmpeg
+                job.state = "recording"
+
+            for b in buckets.values():
+                b["cpu_pct"] = round(b["cpu_pct"], 1)
+            job.sample = {**buckets, "recording_bytes": rec_bytes}
+            for name, b in buckets.items():
+                for k in ("procs", "rss_bytes", "pss_bytes", "cpu_pct"):
+                    totals[name][k] += b[k]
+            totals["recording_bytes"] += rec_bytes
+            self._enforce_limits(job, buckets, tree, now)
+
+        for name in ("bot", "chrome", "ffmpeg"):
+            totals[name]["cpu_pct"] = round(totals[name]["cpu_pct"], 1)
+
+        try:
+            du = shutil.disk_usage(self.record_dir)
+            disk = {"path": str(self.record_dir), "free_bytes": du.free, "total_bytes": du.total}
+        except OSError:
+            disk = {"path": str(self.record_dir), "free_bytes": None, "total_bytes": None}
+
+        with self._lock:
+            for fname, job in list(self._jobs.items()):
+                if job.ended_at and now - job.ended_at > JOB_RETENTION:
+                    del self._jobs[fname]
+            active = [j for j in self._jobs.values() if j.state != "exited"]
+            self._snapshot = {
+                "sampled_at": int(now),
+                "interval_s": self.interval,
+                "queue_depth": sum(1 for j in active if j.state == "queued"),
+                "jobs_running": len(active),
+                "disk": disk,
+                "totals": totals,
+                "jobs": [j.as_dict() for j in self._jobs.values()],
+            }
+
+        self._prev_ticks = {pid: info[2] for pid, info in table.items()}
+        self._prev_at = now
+
+    def _enforce_limits(self, job: Job, buckets: dict, tree: list, now: float):
+        if job.limit_hit:
+            if not job.killed and now - job.term_sent_at > JOB_KILL_GRACE:
+                print(f"[metrics] Job {job.filename} still alive {JOB_KILL_GRACE}s after SIGTERM. "
+                      f"Sending SIGKILL to {len(tree)} processes...")
+                job.killed = True
+                for pid in reversed(tree):
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+            return
+        pss = sum(b["pss_bytes"] for b in buckets.values())
+        cpu = sum(b["cpu_pct"] for b in buckets.values())
+        reason = None
+        if JOB_MAX_PSS_MB and pss > JOB_MAX_PSS_MB * 1024 * 1024:
+            reason = "memory"
+        elif JOB_MAX_CPU_PCT and cpu > JOB_MAX_CPU_PCT:
+            reason = "cpu"
+        job._over_limit = job._over_limit + 1 if reason else 0
+        if reason and job._over_limit >= JOB_LIMIT_SAMPLES:
+            print(f"[metrics] Job {job.filename} over {reason} limit. Sending SIGTERM to pid {job.proc.pid}...")
+            job.limit_hit = reason
+            job.term_sent_at = now
+            try:
+                job.proc.send_signal(signal.SIGTERM)
+            except Exception:
+                pass
+
+
+def render_prometheus(snap: dict) -> str:
+    """Snapshot -> text exposition của Prometheus (toàn bộ là gauge)."""
+    lines = []
+
+    def family(name, samples):
+        samples = [(labels, v) for labels, v in samples if v is not None]
+        if not samples:
+            return
+        lines.append(f"# TYPE meetbot_{name} gauge")
+        for labels, v in samples:
+            lbl = ",".join(f'{k}="{val}"' for k, val in labels.items())
+            lines.append(f"meetbot_{name}{{{lbl}}} {v}" if lbl else f"meetbot_{name} {v}")
+
+    components = ("bot", "chrome", "ffmpeg")
+    totals = snap.get("totals") or {}
+    disk = snap.get("disk") or {}
+    jobs = [j for j in snap.get("jobs", []) if j["state"] != "exited"]
+
+    family("queue_depth", [({}, snap.get("queue_depth"))])
+    family("jobs_running", [({}, snap.get("jobs_running"))])
+    family("disk_free_bytes", [({"path": disk.get("path")}, disk.get("free_bytes"))])
+    family("recording_bytes", [({}, totals.get("recording_bytes"))])
+    for metric, key in (("rss_bytes", "rss_bytes"), ("pss_bytes", "pss_bytes"), ("cpu_percent", "cpu_pct")):
+        family(metric, [({"component": c}, (totals.get(c) or {}).get(key)) for c in components])
+    family("job_recording_bytes", [({"job": j["filename"]}, j.get("recording_bytes")) for j in jobs])
+    for metric, key in (("job_rss_bytes", "rss_bytes"), ("job_pss_bytes", "pss_bytes"), ("job_cpu_percent", "cpu_pct")):
+        family(metric, [
+            ({"job": j["filename"], "component": c}, (j.get(c) or {}).get(key))
+            for j in jobs for c in components
+        ])
+    return "\n".join(lines) + "\n"
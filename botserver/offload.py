@@ -0,0 +1,298 @@
+# botserver/offload.py
+"""
+Đẩy file ghi hình lên object storage tương thích S3 (AWS S3, MinIO, R2...).
+
+Multipart song song, có thể resume: tiến độ từng part được lưu ở
+<file>.upload.json cạnh file ghi; chạy lại sẽ chỉ upload các part còn thiếu.
+
+Toàn vẹn dữ liệu: mỗi part gửi kèm Content-MD5 + ChecksumSHA256 (server từ chối part hỏng).
+Client so thêm checksum SHA256 nếu store trả về, và chỉ so ETag với MD5 khi object
+không mã hoá SSE-KMS/SSE-C (khi đó ETag không phải MD5).
+
+Cấu hình bằng env (tắt nếu không có S3_BUCKET):
+  - S3_BUCKET, S3_PREFIX (mặc định "recordings/")
+  - S3_ENDPOINT_URL (vd: http://minio:9000), S3_REGION
+  - AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY (chuẩn boto3)
+  - S3_PART_SIZE_MB (mặc định 16), S3_CONCURRENCY (mặc định 4)
+  - S3_PUBLIC_BASE: URL public của bucket; nếu trống dùng presigned URL (S3_URL_EXPIRES giây)
+  - S3_EVICT_LOCAL=1: xoá bản local sau khi upload + verify xong
+
+Chạy tay (resume / test với MinIO):
+  python3 botserver/offload.py /var/app/recordings/rec-xxxx.mkv
+"""
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+S3_BUCKET = os.getenv("S3_BUCKET", "").strip() or None
+S3_PREFIX = os.getenv("S3_PREFIX", "recordings/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "").strip() or None
+S3_REGION = os.getenv("S3_REGION", "").strip() or None
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE_MB", "16")) * 1024 * 1024
+S3_CONCURRENCY = int(os.getenv("S3_CONCURRENCY", "4"))
+S3_PUBLIC_BASE = os.getenv("S3_PUBLIC_BASE", "").rstrip("/")
+S3_URL_EXPIRES = int(os.getenv("S3_URL_EXPIRES", "604800"))
+S3_EVICT_LOCAL = os.getenv("S3_EVICT_LOCAL", "0").lower() in ("1", "true", "yes")
+
+MIN_PART_SIZE = 5 * 1024 * 1024     # giới hạn của S3 (trừ part cuối)
+MAX_PARTS = 10000
+
+_client_lock = threading.Lock()
+_client = None
+
+
+class UploadError(Exception):
+    pass
+
+
+def enabled() -> bool:
+    return bool(S3_BUCKET)
+
+
+def object_key(filename: str) -> str:
+    return f"{S3_PREFIX}{filename}"
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            import boto3
+            from botocore.config import Config
+            _client = boto3.client(
+                "s3",
+                endpoint_url=S3_ENDPOINT_URL,
+                region_name=S3_REGION,
+                config=Config(
+                    max_pool_connections=S3_CONCURRENCY + 2,
+                    retries={"max_attempts": 5, "mode": "standard"},
+                ),
+            )
+        return _client
+
+
+def object_url(filename: str) -> str:
+    key = object_key(filename)
+    if S3_PUBLIC_BASE:
+        return f"{S3_PUBLIC_BASE}/{key}"
+    return get_client().generate_presigned_url(
+        "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=S3_URL_EXPIRES
+    )
+
+
+def _head(filename: str) -> bool:
+    from botocore.exceptions import ClientError
+    try:
+        get_client().head_object(Bucket=S3_BUCKET, Key=object_key(filename))
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+
+def object_exists(filename: str) -> bool:
+    """False cả khi S3 lỗi/không kết nối được (để view trả 404 thay vì 500)."""
+    from botocore.exceptions import BotoCoreError, ClientError
+    try:
+        return _head(filename)
+    except (ClientError, BotoCoreError) as e:
+        print(f"[offload] head_object {filename} failed: {e}")
+        return False
+
+
+def delete_object(filename: str) -> bool:
+    """Xoá object; False nếu không có. Lỗi S3 được raise để caller biết object có thể vẫn còn."""
+    if not _head(filename):
+        return False
+    get_client().delete_object(Bucket=S3_BUCKET, Key=object_key(filename))
+    return True
+
+
+def discard_upload(path) -> bool:
+    """Huỷ multipart upload dở dang (nếu có) và xoá <file>.upload.json."""
+    sp = _state_path(Path(path))
+    if not sp.exists():
+        return False
+    try:
+        state = json.loads(sp.read_text())
+        if enabled():
+            get_client().abort_multipart_upload(Bucket=S3_BUCKET, Key=state["key"], UploadId=state["upload_id"])
+    except Exception as e:
+        print(f"[offload] Cannot abort upload for {sp.name}: {e}")
+    sp.unlink(missing_ok=True)
+    return True
+
+
+# ---------- Multipart ----------
+def _state_path(path: Path) -> Path:
+    return path.with_name(path.name + ".upload.json")
+
+
+def _save_state(path: Path, state: dict):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+
+
+def _part_size(size: int) -> int:
+    ps = max(S3_PART_SIZE, MIN_PART_SIZE)
+    while ps * MAX_PARTS < size:
+        ps *= 2
+    return ps
+
+
+def _plain_md5_etag(resp: dict) -> bool:
+    # SSE-KMS / SSE-C: ETag không phải MD5 của dữ liệu
+    return resp.get("ServerSideEncryption") in (None, "AES256") and not resp.get("SSECustomerAlgorithm")
+
+
+def _list_parts(client, key: str, upload_id: str) -> dict:
+    parts, marker = {}, 0
+    while True:
+        resp = client.list_parts(Bucket=S3_BUCKET, Key=key, UploadId=upload_id, PartNumberMarker=marker)
+        for p in resp.get("Parts", []):
+            parts[p["PartNumber"]] = p["ETag"].strip('"')
+        if not resp.get("IsTruncated"):
+            return parts
+        marker = resp["NextPartNumberMarker"]
+
+
+def _load_or_create(client, path: Path, key: str, size: int, mtime: float) -> dict:
+    """Dùng lại multipart upload dở dang nếu file không đổi, ngược lại tạo mới."""
+    sp = _state_path(path)
+    if sp.exists():
+        try:
+            state = json.loads(sp.read_text())
+            if (state.get("key"), state.get("size"), state.get("mtime")) == (key, size, mtime):
+                remote = _list_parts(client, key, state["upload_id"])
+                state["parts"] = {
+                    n: p for n, p in state.get("parts", {}).items()
+                    if remote.get(int(n)) == p["etag"]
+                }
+                return state
+            client.abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=state["upload_id"])
+        except Exception as e:
+            print(f"[offload] Cannot resume {sp.name}: {e}. Starting over.")
+
+    resp = client.create_multipart_upload(Bucket=S3_BUCKET, Key=key, ChecksumAlgorithm="SHA256")
+    state = {
+        "key": key,
+        "upload_id": resp["UploadId"],
+        "size": size,
+        "mtime": mtime,
+        "part_size": _part_size(size),
+        "parts": {},
+    }
+    _save_state(sp, state)
+    return state
+
+
+def upload_file(path, evict: bool = S3_EVICT_LOCAL) -> dict:
+    """
+    Upload `path` lên S3, verify checksum và trả về thông tin + throughput.
+    Lỗi giữa chừng -> raise UploadError, giữ lại state để lần sau resume.
+    """
+    if not enabled():
+        raise UploadError("S3_BUCKET is not set")
+    path = Path(path)
+    st = path.stat()
+    client = get_client()
+    key = object_key(path.name)
+    state = _load_or_create(client, path, key, st.st_size, st.st_mtime)
+    ps = state["part_size"]
+    total_parts = max(1, -(-st.st_size // ps))
+    done = state["parts"]
+    todo = [n for n in range(1, total_parts + 1) if str(n) not in done]
+    resumed = total_parts - len(todo)
+    lock = threading.Lock()
+    sp = _state_path(path)
+
+    def put_part(n: int):
+        with open(path, "rb") as f:
+            f.seek((n - 1) * ps)
+            data = f.read(ps)
+        md5 = hashlib.md5(data)
+        sha = base64.b64encode(hashlib.sha256(data).digest()).decode("ascii")
+        resp = client.upload_part(
+            Bucket=S3_BUCKET, Key=key, UploadId=state["upload_id"], PartNumber=n, Body=data,
+            ContentMD5=base64.b64encode(md5.digest()).decode("ascii"), ChecksumSHA256=sha,
+        )
+        etag = resp["ETag"].strip('"')
+        if resp.get("ChecksumSHA256") not in (None, sha):
+            raise UploadError(f"part {n}: ChecksumSHA256 {resp['ChecksumSHA256']} != {sha}")
+        if _plain_md5_etag(resp) and etag != md5.hexdigest():
+            raise UploadError(f"part {n}: ETag {etag} != md5 {md5.hexdigest()}")
+        with lock:
+            done[str(n)] = {"etag": etag, "md5": md5.hexdigest(), "sha256": sha}
+            _save_state(sp, state)
+        return len(data)
+
+    started = time.time()
+    sent = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, S3_CONCURRENCY)) as pool:
+            for fut in as_completed([pool.submit(put_part, n) for n in todo]):
+                sent += fut.result()
+
+        parts = [
+            {"PartNumber": n, "ETag": f'"{done[str(n)]["etag"]}"', "ChecksumSHA256": done[str(n)]["sha256"]}
+            for n in range(1, total_parts + 1)
+        ]
+        resp = client.complete_multipart_upload(
+            Bucket=S3_BUCKET, Key=key, UploadId=state["upload_id"], MultipartUpload={"Parts": parts}
+        )
+    except UploadError:
+        raise
+    except Exception as e:
+        raise UploadError(str(e)) from e
+
+    # checksum/ETag của multipart = hash(nối digest các part) + "-<số part>"
+    ordered = [done[str(n)] for n in range(1, total_parts + 1)]
+    sha_digest = hashlib.sha256(b"".join(base64.b64decode(p["sha256"]) for p in ordered)).digest()
+    expected_sha = f"{base64.b64encode(sha_digest).decode('ascii')}-{total_parts}"
+    if resp.get("ChecksumSHA256") not in (None, expected_sha):
+        raise UploadError(f"object ChecksumSHA256 {resp['ChecksumSHA256']} != expected {expected_sha}")
+    etag = resp["ETag"].strip('"')
+    composite = hashlib.md5(b"".join(bytes.fromhex(p["md5"]) for p in ordered))
+    expected = f"{composite.hexdigest()}-{total_parts}"
+    if _plain_md5_etag(resp) and etag != expected:
+        raise UploadError(f"object ETag {etag} != expected {expected}")
+
+    elapsed = max(time.time() - started, 1e-6)
+    sp.unlink(missing_ok=True)
+    if evict:
+        path.unlink(missing_ok=True)
+
+    info = {
+        "bucket": S3_BUCKET,
+        "key": key,
+        "etag": etag,
+        "checksum_sha256": expected_sha,
+        "bytes": st.st_size,
+        "bytes_sent": sent,
+        "parts": total_parts,
+        "resumed_parts": resumed,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(sent / elapsed / (1024 * 1024), 2),
+        "evicted": evict,
+        "url": object_url(path.name),
+    }
+    print(f"[offload] Uploaded {path.name} -> s3://{S3_BUCKET}/{key} "
+          f"({total_parts} parts, {resumed} resumed, {info['mb_per_s']} MB/s)")
+    return info
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: offload.py FILE [FILE...]")
+        sys.exit(2)
+    for p in sys.argv[1:]:
+        print(json.dumps(upload_file(p), indent=2))
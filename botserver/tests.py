@@ -1,3 +1,338 @@
-from django.test import TestCase
+import os
+import time
+import re
+import json
+import signal
+import shutil
+import base64
+import hashlib
+import tempfile
+import unittest
+import subprocess
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, AsyncClient
+
+from . import metrics, offload, views
+
+try:
+    from moto import mock_aws     # moto kéo theo boto3; cả hai là tuỳ chọn
+except ImportError:
+    mock_aws = None
+
+
+class ProcTableTests(TestCase):
+    def test_parse_stat_comm_with_spaces_and_parens(self):
+        # pid (comm) state ppid pgrp session tty tpgid flags minflt cminflt majflt cmajflt utime stime ... rss
+        fields = ["S", "42"] + ["0"] * 9 + ["150", "50"] + ["0"] * 8 + ["1000"]
+        raw = "1234 (Web Content (x)) " + " ".join(fields) + " 0 0\n"
+        ppid, comm, ticks, rss = metrics._parse_stat(raw)
+        self.assertEqual(ppid, 42)
+        self.assertEqual(comm, "Web Content (x)")
+        self.assertEqual(ticks, 200)
+        self.assertEqual(rss, 1000 * metrics._PAGE_SIZE)
+
+    def test_read_proc_table_contains_self(self):
+        table = metrics._read_proc_table()
+        ppid, comm, ticks, rss = table[os.getpid()]
+        self.assertEqual(ppid, os.getppid())
+        self.assertGreater(rss, 0)
+        self.assertGreater(metrics._read_pss(os.getpid()), 0)
+
+
+@unittest.skipUnless(shutil.which("node"), "node not installed")
+class CaptionFreshTests(TestCase):
+    """Chạy fresh() trong CAPTIONS_OBSERVER_JS bằng node (đọc source, không import selenium)."""
+
+    CASES = [
+        ("hello world", "hello world how are you", "how are you"),
+        ("we will meet tomorow", "we will meet tomorrow at ten", "tomorrow at ten"),
+        ("line one. line two.", "line two. line three.", "line three."),
+        ("I said no", "I said nothing more", "nothing more"),
+        ("we meet at 3", "we meet at 30 past", "30 past"),
+        ("", "first words", "first words"),
+        ("same text", "same text", ""),
+    ]
+
+    def test_fresh(self):
+        src = (Path(__file__).parent / "meetbot.py").read_text(encoding="utf-8")
+        fn = re.search(r"^function fresh\(.*?^}", src, re.S | re.M).group(0)
+        script = fn + "\nconst cases = JSON.parse(process.argv[1]);\n" \
+            "console.log(JSON.stringify(cases.map(([p, c]) => fresh(p, c))));"
+        out = subprocess.run(
+            ["node", "-e", script, json.dumps([[p, c] for p, c, _ in self.CASES])],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(json.loads(out), [want for _, _, want in self.CASES])
+
+
+class JobRegistryTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.registry = metrics.JobRegistry(self.tmp)
+        # gọi _collect() trực tiếp, không chạy thread nền
+        p = mock.patch.object(self.registry, "_ensure_started")
+        p.start()
+        self.addCleanup(p.stop)
+        self.proc = subprocess.Popen(["sleep", "30"])
+        self.addCleanup(self._reap)
+        self.registry.register(self.proc, "rec-a.mkv", "https://meet.google.com/abc-defg-hij")
+
+    def _reap(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+    def _collect_until_exited(self):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            self.registry._collect()
+            if self.registry.job("rec-a.mkv")["state"] == "exited":
+                return self.registry.job("rec-a.mkv")
+            time.sleep(0.05)
+        self.fail("job never marked exited")
+
+    def test_state_transitions_and_reaping(self):
+        self.registry._collect()
+        snap = self.registry._snapshot
+        self.assertEqual(snap["jobs"][0]["state"], "queued")
+        self.assertEqual((snap["queue_depth"], snap["jobs_running"]), (1, 1))
+        self.assertEqual(snap["jobs"][0]["bot"]["procs"], 1)
+        self.assertIsNotNone(snap["disk"]["free_bytes"])
+
+        (self.tmp / "rec-a.mkv").write_bytes(b"x" * 1000)
+        self.registry._collect()
+        snap = self.registry._snapshot
+        self.assertEqual(snap["jobs"][0]["state"], "recording")
+        self.assertEqual(snap["jobs"][0]["recording_bytes"], 1000)
+        self.assertEqual((snap["queue_depth"], snap["jobs_running"]), (0, 1))
+
+        self.proc.kill()
+        job = self._collect_until_exited()
+        self.assertEqual(job["returncode"], -signal.SIGKILL)     # poll() trong collector đã reap
+        self.assertEqual(self.registry._snapshot["jobs_running"], 0)
+
+    def test_retention_prunes_exited_jobs(self):
+        self.proc.kill()
+        self._collect_until_exited()
+        with mock.patch.object(metrics, "JOB_RETENTION", 0):
+            time.sleep(0.01)
+            self.registry._collect()
+        self.assertIsNone(self.registry.job("rec-a.mkv"))
+        self.assertEqual(self.registry._snapshot["jobs"], [])
+
+    def test_limit_needs_consecutive_samples_then_escalates_to_sigkill(self):
+        with mock.patch.object(metrics, "JOB_MAX_PSS_MB", 100), \
+                mock.patch.object(metrics, "JOB_LIMIT_SAMPLES", 2), \
+                mock.patch.object(metrics, "JOB_KILL_GRACE", 0), \
+                mock.patch.object(self.proc, "send_signal") as send_signal:
+            with mock.patch.object(metrics, "_read_pss", return_value=512 * 1024 * 1024):
+                self.registry._collect()
+            with mock.patch.object(metrics, "_read_pss", return_value=1024):
+                self.registry._collect()        # xuống dưới ngưỡng -> đếm lại từ đầu
+            with mock.patch.object(metrics, "_read_pss", return_value=512 * 1024 * 1024):
+                self.registry._collect()
+                send_signal.assert_not_called()
+                self.registry._collect()
+                send_signal.assert_called_once_with(signal.SIGTERM)
+                self.assertEqual(self.registry.job("rec-a.mkv")["limit_hit"], "memory")
+
+                # SIGTERM bị "bỏ qua" (mock) -> hết grace thì SIGKILL cả cây
+                time.sleep(0.01)
+                self.registry._collect()
+        self.assertEqual(self.proc.wait(timeout=5), -signal.SIGKILL)
+        self.assertTrue(self.registry.job("rec-a.mkv")["killed"])
+
+    def test_render_prometheus(self):
+        self.registry._collect()
+        text = metrics.render_prometheus(self.registry._snapshot)
+        self.assertIn("# TYPE meetbot_queue_depth gauge\nmeetbot_queue_depth 1\n", text)
+        self.assertIn('meetbot_job_pss_bytes{job="rec-a.mkv",component="bot"}', text)
+        self.assertNotIn("_total", text)
+        # mỗi family liền một khối, TYPE đứng trước sample
+        names = [l.split("{")[0].split()[0] for l in text.splitlines() if not l.startswith("#")]
+        families = [n for i, n in enumerate(names) if i == 0 or names[i - 1] != n]
+        self.assertEqual(len(families), len(set(families)))
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        p = mock.patch.object(views, "JOBS", metrics.JobRegistry(self.tmp, interval=3600))
+        p.start()
+        self.addCleanup(p.stop)
+
+    async def test_first_request_has_full_schema(self):
+        resp = await AsyncClient().get("/api/metrics")
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.content)
+        for key in ("sampled_at", "queue_depth", "jobs_running", "disk", "totals", "jobs"):
+            self.assertIn(key, data)
+        self.assertEqual(data["disk"]["path"], str(self.tmp))
+
+    async def test_prometheus_format(self):
+        resp = await AsyncClient().get("/api/metrics", {"format": "prometheus"})
+        self.assertTrue(resp["Content-Type"].startswith("text/plain"))
+        self.assertIn(b"meetbot_jobs_running 0", resp.content)
+
+
+@unittest.skipUnless(mock_aws, "boto3/moto not installed")
+class OffloadTests(TestCase):
+    PART = 5 * 1024 * 1024
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        env = mock.patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "x", "AWS_SECRET_ACCESS_KEY": "x"})
+        env.start()
+        self.addCleanup(env.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        for name, value in {
+            "S3_BUCKET": "meetbot-test", "S3_ENDPOINT_URL": None, "S3_REGION": "us-east-1",
+            "S3_PART_SIZE": self.PART, "S3_PUBLIC_BASE": "", "_client": None,
+        }.items():
+            p = mock.patch.object(offload, name, value)
+            p.start()
+            self.addCleanup(p.stop)
+        self.client_s3 = offload.get_client()
+        self.client_s3.create_bucket(Bucket="meetbot-test")
+
+        self.path = self.tmp / "rec-test.mkv"
+        self.data = os.urandom(2 * self.PART + 1234)        # 3 part
+        self.path.write_bytes(self.data)
+
+    def test_resume_after_interrupted_part(self):
+        real_upload_part = self.client_s3.upload_part
+
+        def flaky(**kw):
+            if kw["PartNumber"] == 2:
+                raise RuntimeError("connection reset")
+            return real_upload_part(**kw)
+
+        with mock.patch.object(self.client_s3, "upload_part", side_effect=flaky):
+            with self.assertRaises(offload.UploadError):
+                offload.upload_file(self.path, evict=False)
+        self.assertTrue((self.tmp / "rec-test.mkv.upload.json").exists())
+        self.assertFalse(offload.object_exists("rec-test.mkv"))
+
+        with mock.patch.object(self.client_s3, "upload_part", side_effect=real_upload_part) as up:
+            info = offload.upload_file(self.path, evict=True)
+        self.assertEqual([c.kwargs["PartNumber"] for c in up.call_args_list], [2])
+        self.assertEqual(info["parts"], 3)
+        self.assertEqual(info["resumed_parts"], 2)
+
+        md5s = b"".join(
+            hashlib.md5(self.data[i:i + self.PART]).digest() for i in range(0, len(self.data), self.PART)
+        )
+        self.assertEqual(info["etag"], f"{hashlib.md5(md5s).hexdigest()}-3")
+        shas = b"".join(
+            hashlib.sha256(self.data[i:i + self.PART]).digest() for i in range(0, len(self.data), self.PART)
+        )
+        self.assertEqual(info["checksum_sha256"], f"{base64.b64encode(hashlib.sha256(shas).digest()).decode()}-3")
+        body = self.client_s3.get_object(Bucket="meetbot-test", Key=info["key"])["Body"].read()
+        self.assertEqual(body, self.data)
+
+        self.assertFalse(self.path.exists())
+        self.assertFalse((self.tmp / "rec-test.mkv.upload.json").exists())
+        self.assertTrue(offload.object_exists("rec-test.mkv"))
+
+    def test_get_recording_redirects_only_when_object_exists(self):
+        with mock.patch.object(views, "RECORD_DIR", self.tmp / "empty"):
+            self.assertEqual(self.client.get("/api/recordings/rec-missing.mkv").status_code, 404)
+            self.client_s3.put_object(Bucket="meetbot-test", Key=offload.object_key("rec-up.mkv"), Body=b"x")
+            resp = self.client.get("/api/recordings/rec-up.mkv")
+        self.assertEqual(resp.status_code, 302)
+
+    def test_sse_kms_etags_are_not_compared_to_md5(self):
+        kms = {"ServerSideEncryption": "aws:kms"}
+        with mock.patch.object(self.client_s3, "upload_part",
+                               return_value={"ETag": '"0123456789abcdef0123456789abcdef"', **kms}), \
+                mock.patch.object(self.client_s3, "complete_multipart_upload",
+                                  return_value={"ETag": '"fedcba9876543210fedcba9876543210-3"', **kms}):
+            info = offload.upload_file(self.path, evict=False)
+        self.assertEqual(info["parts"], 3)
+
+    def test_plain_etag_mismatch_still_fails(self):
+        with mock.patch.object(self.client_s3, "upload_part",
+                               return_value={"ETag": '"0123456789abcdef0123456789abcdef"'}):
+            with self.assertRaises(offload.UploadError):
+                offload.upload_file(self.path, evict=False)
+
+    def test_unreachable_endpoint_is_404_not_500(self):
+        from botocore.exceptions import EndpointConnectionError
+        down = EndpointConnectionError(endpoint_url="http://s3.invalid")
+        with mock.patch.object(views, "RECORD_DIR", self.tmp), \
+                mock.patch.object(self.client_s3, "head_object", side_effect=down):
+            self.assertFalse(offload.object_exists("rec-missing.mkv"))
+            self.assertEqual(self.client.get("/api/recordings/rec-missing.mkv").status_code, 404)
+            resp = self.client.delete("/api/recordings/rec-test.mkv/delete")
+        self.assertEqual(resp.status_code, 502)
+        self.assertTrue(json.loads(resp.content)["local_deleted"])
+        self.assertFalse(self.path.exists())
+
+    def test_delete_discards_pending_upload(self):
+        with mock.patch.object(self.client_s3, "upload_part", side_effect=RuntimeError("boom")):
+            with self.assertRaises(offload.UploadError):
+                offload.upload_file(self.path, evict=False)
+        state = self.tmp / "rec-test.mkv.upload.json"
+        self.assertTrue(state.exists())
+        with mock.patch.object(views, "RECORD_DIR", self.tmp):
+            resp = self.client.delete("/api/recordings/rec-test.mkv/delete")
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(self.path.exists())
+        self.assertFalse(state.exists())
+        self.assertEqual(self.client_s3.list_multipart_uploads(Bucket="meetbot-test").get("Uploads", []), [])
+
+
+class AsyncApiTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        registry = metrics.JobRegistry(self.tmp, interval=3600)
+        noop = self.tmp / "noop_bot.py"
+        noop.write_text("")
+        for name, value in {"RECORD_DIR": self.tmp, "JOBS": registry, "BOT_SCRIPT": str(noop)}.items():
+            p = mock.patch.object(views, name, value)
+            p.start()
+            self.addCleanup(p.stop)
+        self.registry = registry
+
+    async def test_streams_recording_over_asgi(self):
+        data = os.urandom(3 * views.STREAM_CHUNK + 17)
+        (self.tmp / "rec-x.mkv").write_bytes(data)
+        resp = await AsyncClient().get("/api/recordings/rec-x.mkv")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_async)
+        body = b"".join([chunk async for chunk in resp.streaming_content])
+        self.assertEqual(body, data)
+        self.assertEqual(resp["Content-Length"], str(len(data)))
+        self.assertEqual(resp["Content-Disposition"], 'attachment; filename="rec-x.mkv"')
+
+    async def test_stream_stops_at_content_length_while_file_grows(self):
+        path = self.tmp / "rec-grow.mkv"
+        path.write_bytes(b"a" * 1000)
+        chunks = []
+        async for chunk in views._iter_file(path, 1000):
+            if not chunks:
+                with open(path, "ab") as f:      # ffmpeg vẫn đang ghi
+                    f.write(b"b" * 500)
+            chunks.append(chunk)
+        self.assertEqual(b"".join(chunks), b"a" * 1000)
+
+    async def test_submit_returns_202_and_registers_job(self):
+        resp = await AsyncClient().post(
+            "/api/meet", {"meetlink": "https://meet.google.com/abc-defg-hij", "message_id": "m1"},
+            content_type="application/json",
+        )
+        self.assertEqual(resp.status_code, 202)
+        data = json.loads(resp.content)
+        job = self.registry.job(data["filename"])
+        self.assertIsNotNone(job)
+        self.assertEqual((job["pid"], job["message_id"]), (data["pid"], "m1"))
+        self.assertEqual(data["status_url"], f"/api/jobs/{data['filename']}")
+        self.registry._jobs[data["filename"]].proc.wait(timeout=10)
@@ -6,4 +6,6 @@ urlpatterns = [
     path('api/meet', views.api_submit_url, name='api_submit_url'),
     path('api/recordings/<str:fname>', views.api_get_recording, name='api_get_recording'),
     path("api/recordings/<str:fname>/delete", views.api_delete_record, name="api_delete_record"),
+    path('api/jobs/<str:fname>', views.api_job_status, name='api_job_status'),
+    path('api/metrics', views.api_metrics, name='api_metrics'),
 ]
\ No newline at end of file
@@ -4,13 +4,22 @@ from django.http import JsonResponse, HttpResponseNotAllowed
 from django.views.decorators.csrf import csrf_exempt
 from pathlib import Path
 from uuid import uuid4
-from django.http import JsonResponse, FileResponse, Http404
+from django.http import JsonResponse, FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.http import content_disposition_header
+import asyncio, mimetypes
 import json, re, subprocess, shlex
 import os
 
+from . import offload
+from .metrics import JobRegistry, render_prometheus
 
-RECORD_DIR = Path("/var/app/recordings")
+
+RECORD_DIR = Path(os.getenv("REC_DIR", "/var/app/recordings"))
+BOT_SCRIPT = os.getenv("MEETBOT_SCRIPT", "./botserver/meetbot.py")
+STREAM_CHUNK = int(os.getenv("STREAM_CHUNK_KB", "256")) * 1024   # mỗi kết nối download chỉ giữ ~1 chunk
 MEET_RE = re.compile(r"^https?://meet\.google\.com/[a-z0-9-]+(\?.*)?$", re.I)
+JOBS = JobRegistry(RECORD_DIR)
 
 def index(request):
     if request.method == "POST":
@@ -20,7 +29,7 @@ def index(request):
     return render(request,'index.html',context=None)
 
 @csrf_exempt
-def api_submit_url(request):
+async def api_submit_url(request):
     if request.method != "POST":
         return HttpResponseNotAllowed(["POST"])
 
@@ -32,48 +41,109 @@ def api_submit_url(request):
         link = (data.get("meetlink") or data.get("link") or "").strip()
         message_id = str(data.get("message_id", "")).strip() or None
         headless = str(data.get("headless","")).lower() in ("1","true","yes")
+        transcript = str(data.get("transcript","")).lower() in ("1","true","yes")
+        video = str(data.get("video","1")).lower() not in ("0","false","no")
     else:
         link = request.POST.get("meetlink","").strip()
         message_id = request.POST.get("message_id","").strip() or None
         headless = str(request.POST.get("headless","")).lower() in ("1","true","yes")
+        transcript = str(request.POST.get("transcript","")).lower() in ("1","true","yes")
+        video = str(request.POST.get("video","1")).lower() not in ("0","false","no")
 
     if not link or not MEET_RE.match(link):
         return JsonResponse({"error": "Invalid Google Meet link"}, status=400)
+    if not (video or transcript):
+        return JsonResponse({"error": "Nothing to capture: enable video or transcript"}, status=400)
 
     # 1) tạo tên file trước ở view
-    filename = f"rec-{uuid4().hex}.mkv"   # hoặc .mp4 nếu bạn đổi container
+    base = f"rec-{uuid4().hex}"
+    transcript_name = f"{base}.transcript.jsonl" if transcript else None
+    filename = f"{base}.mkv" if video else transcript_name   # hoặc .mp4 nếu bạn đổi container
     os.makedirs(RECORD_DIR, exist_ok=True)
 
     # 2) gọi meetbot và truyền REC_OUT qua ENV
     env = os.environ.copy()
     env["REC_OUT"] = filename
-    env["MESSAGE_ID"] = message_id
+    env["MESSAGE_ID"] = message_id or ""
+    if transcript_name:
+        env["TRANSCRIPT_OUT"] = transcript_name
     # (tuỳ chọn) bạn cũng có thể set REC_DIR/REC_WIDTH/REC_HEIGHT ở đây
 
-    subprocess.run(["chmod","+x","./botserver/meetbot.py"], check=False)
-    args = ['python3','./botserver/meetbot.py', link]
+    args = ['python3', BOT_SCRIPT, link]
     if headless:
         args.append('--headless')
+    if transcript:
+        args.append('--transcript')
+    if not video:
+        args.append('--no-video')
 
-    proc = subprocess.Popen(args, env=env,
-                            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    # fork/exec chạy ngoài event loop để không chặn các request khác
+    proc = await asyncio.to_thread(subprocess.Popen, args, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    JOBS.register(proc, filename, link, message_id)
 
     # 3) trả về ngay cho client
-    return JsonResponse({
+    resp = {
         "status": "queued",
         "pid": proc.pid,
         "meetlink": link,
         "filename": filename,
         "message_id": message_id,
-        "file_url": f"/api/recordings/{filename}"
-    }, status=202)
-    
-def api_get_recording(request, fname: str):
+        "file_url": f"/api/recordings/{filename}",
+        "status_url": f"/api/jobs/{filename}"
+    }
+    if transcript_name:
+        resp["transcript_filename"] = transcript_name
+        resp["transcript_url"] = f"/api/recordings/{transcript_name}"
+    return JsonResponse(resp, status=202)
+
+async def api_metrics(request):
+    snap = JOBS.snapshot()
+    if request.GET.get("format") == "prometheus":
+        return HttpResponse(render_prometheus(snap), content_type="text/plain; version=0.0.4")
+    return JsonResponse(snap)
+
+async def api_job_status(request, fname: str):
+    job = JOBS.job(os.path.basename(fname))
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    return JsonResponse(job)
+
+async def _iter_file(path: Path, size: int):
+    # chỉ gửi đúng `size` byte (= Content-Length) dù ffmpeg vẫn đang ghi thêm vào file
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        remaining = size
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(STREAM_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk   # ASGI server chỉ lấy chunk tiếp khi client đã nhận (backpressure)
+    finally:
+        await asyncio.to_thread(f.close)
+
+async def api_get_recording(request, fname: str):
     safe = os.path.basename(fname)             # chống path traversal
     path = RECORD_DIR / safe
     if not (path.exists() and path.is_file()):
+        # boto3 (import, tạo client, head_object) là blocking -> chạy ngoài event loop
+        if offload.enabled() and await asyncio.to_thread(offload.object_exists, safe):
+            url = await asyncio.to_thread(offload.object_url, safe)
+            return HttpResponseRedirect(url)                          # đã offload lên S3
         raise Http404("Not found")
-    return FileResponse(open(path, "rb"), as_attachment=True, filename=safe)
+    if not isinstance(request, ASGIRequest):
+        # WSGI (runserver) sẽ gom async iterator vào RAM -> dùng FileResponse
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=safe)
+
+    size = path.stat().st_size
+    resp = StreamingHttpResponse(
+        _iter_file(path, size),
+        content_type=mimetypes.guess_type(safe)[0] or "application/octet-stream",
+    )
+    resp["Content-Length"] = str(size)
+    resp["Content-Disposition"] = content_disposition_header(True, safe)
+    return resp
 
 @csrf_exempt
 def api_delete_record(request, fname: str):
@@ -83,13 +153,22 @@ def api_delete_record(request, fname: str):
     safe = os.path.basename(fname)  # chống path traversal
     path = RECORD_DIR / safe
 
-    if not path.exists() or not path.is_file():
-        return JsonResponse({"error": "File not found"}, status=404)
-
+    local = path.exists() and path.is_file()
     try:
-        os.remove(path)
+        if local:
+            os.remove(path)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+    pending = offload.discard_upload(path)   # .upload.json + abort multipart dở dang
+
+    try:
+        remote = offload.enabled() and offload.delete_object(safe)
+    except Exception as e:
+        # S3 lỗi/không kết nối được: object có thể vẫn còn, client gọi lại sau
+        return JsonResponse({"error": f"Object storage error: {e}", "local_deleted": local}, status=502)
+
+    if not (local or remote or pending):
+        return JsonResponse({"error": "File not found"}, status=404)
 
     return JsonResponse({
         "status": "deleted",
@@ -101,7 +180,7 @@ def _start_bot(link: str):
     filename = f"rec-{uuid4().hex}.mkv"
     env = os.environ.copy()
     env["REC_OUT"] = filename
-    subprocess.run(["chmod","+x","./botserver/meetbot.py"], check=False)
-    subprocess.Popen(['python3','./botserver/meetbot.py', link],
-                     env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-    return filename
\ No newline at end of file
+    proc = subprocess.Popen(['python3', BOT_SCRIPT, link],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    JOBS.register(proc, filename, link)
+    return filename
@@ -14,5 +14,9 @@ pulseaudio --start --exit-idle-time=-1 || true
 google-chrome --version || true
 python --version
 
-# Chạy Django
-exec python manage.py runserver 0.0.0.0:8000
+# Chạy Django qua ASGI (uvicorn). Giữ 1 worker: JobRegistry/metrics nằm trong process;
+# view async + streaming nên 1 worker vẫn phục vụ song song nhiều request.
+exec uvicorn djangobot.asgi:application \
+    --host 0.0.0.0 --port 8000 \
+    --workers "${WEB_CONCURRENCY:-1}" \
+    --lifespan off